@@ -12,19 +12,76 @@ Falta solucionar el captcha y/0 la consecución del Token
 
 from __future__ import annotations
 import argparse
+import gzip
+import hashlib
 import json
 import logging
+import os
 import re
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:  # opcional: parseo JSON más rápido
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # opcional: parseo en streaming de metadatos grandes
+    import ijson
+except ImportError:
+    ijson = None
 
 BASE = "https://microdatos.dane.gov.co/index.php"
 UA = "DANE-NADA-Extractor/1.0 (+github.com/your-org)"
 LOG = logging.getLogger("nada")
+WORKERS = 8        # descargas de metadatos en paralelo (bajar si el server responde 429)
+POOL_SIZE = 32     # conexiones HTTPS reutilizables entre hilos
+RETRY = Retry(     # reintentos de la sesión (429/5xx), con espera según Retry-After si viene
+    total=5,
+    backoff_factor=0.5,
+    backoff_jitter=0.25,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(["GET"]),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+STRING_DTYPE = pd.StringDtype("pyarrow")   # texto en buffers Arrow contiguos
+INT_DTYPE = pd.ArrowDtype(pa.int64())      # enteros con nulos, mismo backend
+# Cache en disco de /metadata/export (<study_id>.json.gz); "" la desactiva
+CACHE_DIR = os.getenv("NADA_CACHE_DIR", str(Path.home() / ".cache" / "nada"))
+CACHE_TTL = int(os.getenv("NADA_CACHE_TTL", "604800"))  # seg. que vale una entrada (o hasta que cambie el estudio)
+
+VAR_COLUMNS = [
+    "study_id","study_title","var_id","var_name","var_label","var_type",
+    "var_dcml","var_intrvl","var_wgt","file_ids","file_names",
+    "universe","q_preqtext","q_qstnlit","q_postqtxt","notes",
+    "n_categories","categories_json",
+]
+STUDY_COLUMNS = [
+    "study_id","idno","title","sub_title","nation","abbreviation",
+    "year_start","year_end","proddate","repositoryid","version",
+    "abstract","data_kind","geog_coverage","universe_study",
+    "keywords","topics","producers","funding",
+    "access_policy","confidentiality","conditions","disclaimer",
+    "citation_requirement","doi",
+]
+# Tipos fijos (no inferidos): un lote vacío o una columna toda nula no cambia el esquema
+INT_COLUMNS = {"study_id", "n_categories"}
+VAR_DTYPES = {c: INT_DTYPE if c in INT_COLUMNS else STRING_DTYPE for c in VAR_COLUMNS}
+STUDY_DTYPES = {c: INT_DTYPE if c in INT_COLUMNS else STRING_DTYPE for c in STUDY_COLUMNS}
 
 
 # ==================================================
@@ -32,18 +89,18 @@ LOG = logging.getLogger("nada")
 # ==================================================
 def _get(d: Dict, *keys, default=None):
     """Acceso tolerante a llaves anidadas: _get(d, 'a','b','c', default=None)."""
-    cur = d
-    try:
-        for k in keys:
-            if cur is None:
-                return default
-            if isinstance(cur, dict):
-                cur = cur.get(k, default)
-            else:
-                return default
-        return cur if cur is not None else default
-    except Exception:
-        return default
+    for k in keys:
+        if not isinstance(d, dict):
+            return default
+        d = d.get(k)
+        if d is None:
+            return default
+    return d
+
+
+def _json_loads(raw: bytes) -> Any:
+    """json.loads sobre bytes; usa orjson si está instalado."""
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
 
 
 def _norm_list(x) -> List:
@@ -54,9 +111,10 @@ def _norm_list(x) -> List:
     return [x]
 
 
-def _normalize_categories(cat) -> Tuple[Optional[int], Optional[str]]:
+def _normalize_categories(cat) -> Tuple[Optional[int], Optional[List[Dict[str, Any]]]]:
     """
-    Devuelve (#categorías, JSON compacto [{"value":..,"label":..},...]) si existen.
+    Devuelve (#categorías, [{"value":..,"label":..},...]) si existen; el JSON se arma
+    después, en bloque (ver _dump_categories).
     NADA puede exponer 'var_catgry' (dict->list) o 'categories' (list).
     """
     if cat is None:
@@ -75,26 +133,150 @@ def _normalize_categories(cat) -> Tuple[Optional[int], Optional[str]]:
             items.append({"value": val, "label": lab})
         if not items:
             return None, None
-        return len(items), json.dumps(items, ensure_ascii=False)
+        return len(items), items
     except Exception:
         return None, None
 
 
+def _dump_categories(col: List[Any]) -> List[Optional[str]]:
+    """Serializa de una pasada la columna categories_json (JSON compacto; orjson si está)."""
+    if orjson is not None:
+        dumps = orjson.dumps
+        return [dumps(x, default=str).decode() if x else None for x in col]
+    return [json.dumps(x, ensure_ascii=False, separators=(",", ":"), default=str) if x else None for x in col]
+
+
+def _typed_frame(cols: Dict[str, List[Any]], dtypes: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Columnas (listas) -> DataFrame con `dtypes` aplicados directo desde las listas: sin
+    pasar por la inferencia de pandas (int con None -> float64 -> "2019.0").
+    """
+    return pd.DataFrame({c: pd.array(cols[c], dtype=t) for c, t in dtypes.items()}, copy=False)
+
+
 def _retry_get(session: requests.Session, url: str, **kwargs) -> requests.Response:
-    """GET con reintentos simples (429/5xx)."""
-    backoff = 1.0
-    for attempt in range(5):
-        r = session.get(url, timeout=kwargs.get("timeout", 60), params=kwargs.get("params"))
-        if r.status_code < 400:
-            return r
-        if r.status_code in (429, 500, 502, 503, 504):
-            LOG.warning("GET %s -> %s, retry in %.1fs", url, r.status_code, backoff)
-            time.sleep(backoff)
-            backoff *= 2
-            continue
-        r.raise_for_status()
+    """GET que falla en 4xx/5xx; los reintentos (429/5xx) los hace el Retry del adapter."""
+    r = session.get(url, timeout=kwargs.get("timeout", 60), params=kwargs.get("params"),
+                    stream=kwargs.get("stream", False))
     r.raise_for_status()
-    return r  # no llega
+    return r
+
+
+def _iter_stream_variables(raw, md: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre con ijson el JSON de /metadata/export: entrega uno a uno los elementos
+    de `variables` y guarda las demás llaves de primer nivel en `md` (completo
+    solo cuando el iterador se agota).
+    """
+    builder = None       # ObjectBuilder del valor en construcción
+    level = 0            # profundidad donde empezó ese valor
+    depth = 0            # contenedores abiertos antes del evento
+    key = None           # llave de primer nivel en curso
+    in_vars = False
+    for _, event, value in ijson.parse(raw, use_float=True):
+        if event in ("end_map", "end_array"):
+            depth -= 1
+        if builder is not None:
+            builder.event(event, value)
+            if depth == level and event in ("end_map", "end_array"):
+                if in_vars:
+                    yield builder.value
+                else:
+                    md[key] = builder.value
+                builder = None
+        elif depth == 1 and event == "map_key":
+            key = value
+        elif depth == 1 and key == "variables" and event == "start_array":
+            in_vars = True
+        elif depth == 1 and in_vars and event == "end_array":
+            in_vars = False
+        elif depth == (2 if in_vars else 1):
+            if event in ("start_map", "start_array"):
+                builder, level = ijson.ObjectBuilder(), depth
+                builder.event(event, value)
+            elif in_vars:
+                yield value
+            else:
+                md[key] = value
+        if event in ("start_map", "start_array"):
+            depth += 1
+
+
+class _TeeReader:
+    """
+    Lector tipo archivo que copia en `sink` todo lo que lee de `src`. Si la escritura
+    falla (disco lleno, permisos) deja de copiar y marca `failed`: la lectura sigue.
+    """
+
+    def __init__(self, src, sink):
+        self.src = src
+        self.sink = sink
+        self.failed = False
+
+    def read(self, n: int = -1) -> bytes:
+        b = self.src.read(n)
+        if b and not self.failed:
+            try:
+                self.sink.write(b)
+            except OSError as e:
+                LOG.warning("cache: no se pudo escribir (%s); sigo sin cache", e)
+                self.failed = True
+        return b
+
+
+def _iter_closing(it: Iterator[Dict[str, Any]], f) -> Iterator[Dict[str, Any]]:
+    """Consume `it` y cierra `f` al terminar."""
+    with f:
+        yield from it
+
+
+def _iter_caching(it: Iterator[Dict[str, Any]], tee: _TeeReader, tmp: str, path: Path) -> Iterator[Dict[str, Any]]:
+    """Consume `it`; si termina bien publica la cache (tmp -> path), si no la descarta."""
+    try:
+        yield from it
+    except BaseException:
+        _discard_cache_tmp(tee.sink, tmp)
+        raise
+    if tee.failed:
+        _discard_cache_tmp(tee.sink, tmp)
+    else:
+        _publish_cache_tmp(tee.sink, tmp, path)
+
+
+def _open_cache_tmp(path: Path):
+    """
+    Archivo gzip temporal junto a `path` (se renombra al final: escritura atómica).
+    None si la carpeta no se puede crear/escribir: se sigue sin cache.
+    """
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    except OSError as e:
+        LOG.warning("cache: %s no disponible (%s); sigo sin cache", path.parent, e)
+        return None
+    os.close(fd)
+    return gzip.open(tmp, "wb"), tmp
+
+
+def _publish_cache_tmp(sink, tmp: str, path: Path) -> None:
+    """Cierra `sink` y lo publica en `path`; si falla, lo descarta sin abortar."""
+    try:
+        sink.close()
+        os.replace(tmp, path)
+    except OSError as e:
+        LOG.warning("cache: no se pudo guardar %s (%s)", path, e)
+        _discard_cache_tmp(sink, tmp)
+
+
+def _discard_cache_tmp(sink, tmp: str) -> None:
+    try:
+        sink.close()
+    except OSError:
+        pass
+    try:
+        os.unlink(tmp)
+    except OSError:
+        pass
 
 
 # ==================================================
@@ -105,10 +287,24 @@ def _retry_get(session: requests.Session, url: str, **kwargs) -> requests.Respon
 class NadaClient:
     base: str = BASE
     user_agent: str = UA
+    cache_dir: Optional[str] = CACHE_DIR
+    refresh: bool = False          # ignora la cache (igual la reescribe)
+    pool_size: int = POOL_SIZE     # conexiones keep-alive (>= hilos que descargan)
+    cache_ttl: int = CACHE_TTL     # seg. que vale una entrada de la cache
 
     def __post_init__(self):
+        self.changed: Dict[int, int] = {}  # study_id -> 'changed' (epoch) visto en search_catalog
         self.session = requests.Session()
-        self.session.headers.update({"User-Agent": self.user_agent})
+        self.session.headers.update({
+            "User-Agent": self.user_agent,
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",  # urllib3 descomprime (también con stream=True)
+        })
+        # Pool compartido por los hilos de export_metadata: un solo host, cada hilo
+        # conserva su conexión TLS. urllib3 reintenta 429/5xx con backoff exponencial
+        # + jitter y respeta Retry-After.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=RETRY)
+        self.session.mount("https://", adapter)
 
     def search_catalog(
         self,
@@ -141,6 +337,9 @@ class NadaClient:
             if not rows:
                 break
             ids.extend([row.get("id") for row in rows if row.get("id") is not None])
+            # Fecha de última modificación: invalida la cache de estudios re-publicados
+            self.changed.update({row["id"]: int(row["changed"]) for row in rows
+                                 if row.get("id") is not None and str(row.get("changed") or "").isdigit()})
 
             if limit_studies and len(ids) >= limit_studies:
                 return ids[:limit_studies]
@@ -150,42 +349,124 @@ class NadaClient:
                 break
         return ids
 
+    def _cache_path(self, study_id: int) -> Optional[Path]:
+        """<cache_dir>/<host>-<hash de base>/<study_id>.json.gz: un catálogo no sirve el id de otro."""
+        if not self.cache_dir:
+            return None
+        host = re.sub(r"[^0-9A-Za-z.-]+", "_", urlparse(self.base).netloc) or "nada"
+        tag = hashlib.md5(self.base.rstrip("/").encode("utf-8")).hexdigest()[:8]
+        return Path(self.cache_dir) / f"{host}-{tag}" / f"{study_id}.json.gz"
+
+    def _cache_hit(self, study_id: int) -> Optional[Path]:
+        """Entrada vigente: más nueva que cache_ttl y que el 'changed' del estudio (si se conoce)."""
+        p = self._cache_path(study_id)
+        if p is None or self.refresh:
+            return None
+        try:
+            mtime = p.stat().st_mtime
+        except OSError:
+            return None
+        if time.time() - mtime >= self.cache_ttl or mtime < self.changed.get(study_id, 0):
+            LOG.debug("cache vencida %s", p)
+            return None
+        LOG.debug("cache hit %s", p)
+        return p
+
     def export_metadata(self, study_id: int) -> Dict[str, Any]:
-        """/metadata/export/{study_id}/json"""
+        """/metadata/export/{study_id}/json (usa la cache en disco si existe)."""
+        hit = self._cache_hit(study_id)
+        if hit is not None:
+            return _json_loads(gzip.decompress(hit.read_bytes()))
         url = f"{self.base}/metadata/export/{study_id}/json"
         r = _retry_get(self.session, url, timeout=120)
-        return r.json()
+        p = self._cache_path(study_id)
+        opened = _open_cache_tmp(p) if p is not None else None
+        if opened is not None:
+            sink, tmp = opened
+            try:
+                sink.write(r.content)
+            except OSError as e:
+                LOG.warning("cache: no se pudo escribir %s (%s)", p, e)
+                _discard_cache_tmp(sink, tmp)
+            else:
+                _publish_cache_tmp(sink, tmp, p)
+        return _json_loads(r.content)
+
+    def stream_metadata(self, study_id: int) -> Tuple[Dict[str, Any], Iterator[Dict[str, Any]]]:
+        """
+        Igual que export_metadata pero sin materializar el payload (requiere ijson).
+        Devuelve (md, variables): md se va llenando con las llaves de primer nivel
+        mientras se consume el iterador de variables. La cache se lee/escribe en streaming.
+        """
+        md: Dict[str, Any] = {}
+        hit = self._cache_hit(study_id)
+        if hit is not None:
+            f = gzip.open(hit, "rb")
+            return md, _iter_closing(_iter_stream_variables(f, md), f)
+
+        url = f"{self.base}/metadata/export/{study_id}/json"
+        r = _retry_get(self.session, url, timeout=120, stream=True)
+        try:
+            r.raw.decode_content = True  # gzip/deflate transparente
+            p = self._cache_path(study_id)
+            opened = _open_cache_tmp(p) if p is not None else None
+            if opened is None:
+                it = _iter_stream_variables(r.raw, md)
+            else:
+                tee = _TeeReader(r.raw, opened[0])
+                it = _iter_caching(_iter_stream_variables(tee, md), tee, opened[1], p)
+        except BaseException:
+            r.close()
+            raise
+        # La respuesta se cierra al agotar (o abandonar) el iterador
+        return md, _iter_closing(it, r)
 
 
 # ==================================================
 # Parseo 
 # ==================================================
-def parse_study(md: Dict[str, Any], study_id: int) -> Dict[str, Any]:
-    """Fila nivel estudio, robusta a variantes NADA."""
+def _study_parts(md: Dict[str, Any]) -> Dict[str, Any]:
+    """Subárboles de study_desc que usan estudio y variables: se resuelven una sola vez."""
     sd = md.get("study_desc", {}) or {}
-    da = md.get("data_access", {}) or sd.get("data_access", {}) or {}
-    title = md.get("title") or _get(sd, "title_statement", "title", default="")
+    ts = _get(sd, "title_statement", default={})
+    files = md.get("files", []) if isinstance(md.get("files"), list) else []
+    return {
+        "sd": sd,
+        "ts": ts,
+        "si": _get(sd, "study_info", default={}),
+        "ps": _get(sd, "production_statement", default={}),
+        "da": md.get("data_access", {}) or sd.get("data_access", {}) or {},
+        "title": md.get("title") or _get(ts, "title", default=""),
+        "file_map": {f.get("file_id"): f.get("file_name") for f in files if f.get("file_id") is not None},
+    }
+
+
+def parse_study(md: Dict[str, Any], study_id: int, parts: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fila nivel estudio, robusta a variantes NADA. `parts`: ver _study_parts."""
+    if parts is None:
+        parts = _study_parts(md)
+    sd, ts, si, ps, da = parts["sd"], parts["ts"], parts["si"], parts["ps"], parts["da"]
     keywords = [k.get("keyword") or k.get("value") for k in _norm_list(_get(sd, "keywords", "keyword"))]
-    topics = [t.get("topic") or t.get("value") for t in _norm_list(_get(sd, "study_info", "topics", "topic"))]
-    producers = [p.get("name") for p in _norm_list(_get(sd, "production_statement", "producers", "producer"))]
+    topics = [t.get("topic") or t.get("value") for t in _norm_list(_get(si, "topics", "topic"))]
+    producers = [p.get("name") for p in _norm_list(_get(ps, "producers", "producer"))]
     funding = [f.get("name") or f.get("agency") for f in _norm_list(_get(sd, "funding", "agency"))]
 
     return {
         "study_id": study_id,
-        "idno": md.get("idno") or _get(sd, "title_statement", "idno"),
-        "title": title,
-        "sub_title": _get(sd, "title_statement", "sub_title"),
-        "nation": _get(sd, "study_info", "nation", "name"),
-        "abbreviation": _get(sd, "title_statement", "alternate_title"),
-        "year_start": _get(sd, "study_info", "dates", "start"),
-        "year_end": _get(sd, "study_info", "dates", "end"),
-        "proddate": md.get("proddate") or _get(sd, "production_statement", "prod_date"),
+        "idno": md.get("idno") or _get(ts, "idno"),
+        "title": parts["title"],
+        "sub_title": _get(ts, "sub_title"),
+        "nation": _get(si, "nation", "name"),
+        "abbreviation": _get(ts, "alternate_title"),
+        "year_start": _get(si, "dates", "start"),
+        "year_end": _get(si, "dates", "end"),
+        "proddate": md.get("proddate") or _get(ps, "prod_date"),
         "repositoryid": md.get("repositoryid"),
         "version": md.get("version") or _get(sd, "version_statement", "version"),
-        "abstract": _get(sd, "study_info", "abstract"),
-        "data_kind": _get(sd, "study_info", "data_kind"),
-        "geog_coverage": _get(sd, "study_info", "geog_coverage"),
-        "universe_study": _get(sd, "study_info", "universe"),
+        "abstract": _get(si, "abstract"),
+        "data_kind": _get(si, "data_kind"),
+        "geog_coverage": _get(si, "geog_coverage"),
+        "universe_study": _get(si, "universe"),
         "keywords": "; ".join([x for x in keywords if x]),
         "topics": "; ".join([x for x in topics if x]),
         "producers": "; ".join([x for x in producers if x]),
@@ -200,24 +481,86 @@ def parse_study(md: Dict[str, Any], study_id: int) -> Dict[str, Any]:
         "doi": md.get("doi") or _get(sd, "citation", "titlstat", "doi"),
     }
 
+def parse_variables(
+    md: Dict[str, Any],
+    study_id: int,
+    out: Optional[Dict[str, List[Any]]] = None,
+    variables: Optional[Iterable[Dict[str, Any]]] = None,
+    **filters,
+) -> Dict[str, List[Any]]:
+    """
+    Filas nivel variable. Incluye: universe, preguntas (pre/lit/post), formato, categorías, archivo, etc.
+    Acumula en columnas (dict de listas con llaves VAR_COLUMNS): si se pasa `out` se
+    agrega ahí (varios estudios) y se devuelve el mismo dict.
+    `variables` admite un iterable (p. ej. de NadaClient.stream_metadata); los campos
+    de nivel estudio (título, archivos) se leen de `md` después de consumirlo.
+    Filtros (ver run_extraction) se evalúan antes de armar la fila: las variables
+    descartadas no pagan preguntas ni categorías. `categories_json` queda como listas
+    (sin serializar): ver _dump_categories.
+    """
+    if out is None:
+        out = {c: [] for c in VAR_COLUMNS}
+    _parse_variables(md, study_id, out, variables, **filters)
+    return out
 
-def parse_variables(md: Dict[str, Any], study_id: int) -> List[Dict[str, Any]]:
-    """Filas nivel variable. Incluye: universe, preguntas (pre/lit/post), formato, categorías, archivo, etc."""
-    title = md.get("title") or _get(md, "study_desc", "title_statement", "title", default="")
-    files = md.get("files", []) if isinstance(md.get("files"), list) else []
-    file_map = {f.get("file_id"): f.get("file_name") for f in files if f.get("file_id") is not None}
-
-    variables = md.get("variables") or []
-    if not isinstance(variables, list):
-        return []
 
-    out: List[Dict[str, Any]] = []
+def parse_study_and_vars(
+    md: Dict[str, Any],
+    study_id: int,
+    out: Optional[Dict[str, List[Any]]] = None,
+    variables: Optional[Iterable[Dict[str, Any]]] = None,
+    **filters,
+) -> Tuple[Dict[str, Any], Dict[str, List[Any]]]:
+    """parse_study + parse_variables compartiendo un único recorrido de study_desc."""
+    if out is None:
+        out = {c: [] for c in VAR_COLUMNS}
+    parts = _parse_variables(md, study_id, out, variables, **filters)
+    return parse_study(md, study_id, parts), out
+
+
+def _parse_variables(
+    md: Dict[str, Any],
+    study_id: int,
+    out: Dict[str, List[Any]],
+    variables: Optional[Iterable[Dict[str, Any]]] = None,
+    name_set: Optional[set] = None,
+    name_rx: Optional[re.Pattern] = None,
+    lab_rx: Optional[re.Pattern] = None,
+    file_set: Optional[set] = None,
+) -> Dict[str, Any]:
+    """Cuerpo de parse_variables; devuelve _study_parts(md) para reutilizarlo."""
+    if variables is None:
+        variables = md.get("variables") or []
+        if not isinstance(variables, list):
+            return _study_parts(md)
+
+    vars_file_ids: List[Tuple[int, ...]] = []
+    ids_str: Dict[Tuple[int, ...], Optional[str]] = {}  # casi todas las variables comparten archivo
     for v in variables:
         vname = (v.get("name") or v.get("var_name") or "").strip()
         if not vname:
             continue
+        if name_set is not None and vname.lower() not in name_set:
+            continue
+        if name_rx and not name_rx.search(vname):
+            continue
 
         vlabel = (v.get("labl") or v.get("var_label") or v.get("label") or "").strip()
+        if lab_rx and not lab_rx.search(vlabel):
+            continue
+
+        # Archivo(s) asociados
+        vfiles = v.get("files") or v.get("file_id")
+        if isinstance(vfiles, list):
+            v_file_ids = tuple(int(x) for x in vfiles if str(x).isdigit())
+        elif isinstance(vfiles, int):
+            v_file_ids = (vfiles,)
+        else:
+            v_file_ids = ()
+        if file_set and file_set.isdisjoint(v_file_ids):
+            continue
+        vars_file_ids.append(v_file_ids)
+
         vtype = v.get("var_format") or v.get("type") or v.get("vartype") or ""
         vdcml = v.get("var_dcml")
         vintr = v.get("var_intrvl")
@@ -230,38 +573,46 @@ def parse_variables(md: Dict[str, Any], study_id: int) -> List[Dict[str, Any]]:
         postq = _get(v, "qstn", "qstn_postqtxt") or v.get("qstn_postqtxt") or ""
         notes = v.get("notes") or v.get("txt") or ""
 
-        # Archivo(s) asociados
-        vfiles = v.get("files") or v.get("file_id")
-        if isinstance(vfiles, list):
-            v_file_ids = [int(x) for x in vfiles if str(x).isdigit()]
-        elif isinstance(vfiles, int):
-            v_file_ids = [vfiles]
-        else:
-            v_file_ids = []
-
-        ncat, cat_json = _normalize_categories(v.get("var_catgry") or v.get("categories"))
-
-        out.append({
-            "study_id": study_id,
-            "study_title": title,
-            "var_id": v.get("vid") or v.get("uid") or v.get("id"),
-            "var_name": vname,
-            "var_label": vlabel,
-            "var_type": vtype,
-            "var_dcml": vdcml,
-            "var_intrvl": vintr,
-            "var_wgt": vwgt,
-            "file_ids": ";".join(str(x) for x in v_file_ids) if v_file_ids else None,
-            "file_names": ";".join(file_map.get(fid, "") for fid in v_file_ids) if v_file_ids else None,
-            "universe": vuniv,
-            "q_preqtext": preq,
-            "q_qstnlit": qlit,
-            "q_postqtxt": postq,
-            "notes": notes,
-            "n_categories": ncat,
-            "categories_json": cat_json,
-        })
-    return out
+        ncat, cats = _normalize_categories(v.get("var_catgry") or v.get("categories"))
+
+        out["var_id"].append(v.get("vid") or v.get("uid") or v.get("id"))
+        out["var_name"].append(vname)
+        out["var_label"].append(vlabel)
+        out["var_type"].append(vtype)
+        out["var_dcml"].append(vdcml)
+        out["var_intrvl"].append(vintr)
+        out["var_wgt"].append(vwgt)
+        ids = ids_str.get(v_file_ids)
+        if ids is None and v_file_ids:
+            ids = ids_str[v_file_ids] = ";".join(str(x) for x in v_file_ids)
+        out["file_ids"].append(ids)
+        out["universe"].append(vuniv)
+        out["q_preqtext"].append(preq)
+        out["q_qstnlit"].append(qlit)
+        out["q_postqtxt"].append(postq)
+        out["notes"].append(notes)
+        out["n_categories"].append(ncat)
+        out["categories_json"].append(cats)  # se serializa en run_extraction
+
+    # Nivel estudio (en streaming, `md` recién está completo aquí)
+    parts = _study_parts(md)
+    file_map = parts["file_map"]
+
+    n = len(vars_file_ids)
+    out["study_id"].extend([study_id] * n)
+    out["study_title"].extend([parts["title"]] * n)
+    names = {ids: ";".join(file_map.get(fid, "") for fid in ids) for ids in ids_str}
+    out["file_names"].extend(names.get(ids) for ids in vars_file_ids)
+    return parts
+
+
+def _fetch_and_parse(client: NadaClient, study_id: int, **filters) -> Tuple[Dict[str, Any], Dict[str, List[Any]]]:
+    """Descarga y parsea un estudio: (fila de estudio, columnas de variables ya filtradas)."""
+    if ijson is not None:
+        md, variables = client.stream_metadata(study_id)
+        return parse_study_and_vars(md, study_id, variables=variables, **filters)
+    md = client.export_metadata(study_id)
+    return parse_study_and_vars(md, study_id, **filters)
 
 
 # ==================================================
@@ -281,6 +632,8 @@ def run_extraction(
     var_name_regex: Optional[str] = None,
     var_label_regex: Optional[str] = None,
     file_ids_filter: Optional[List[int]] = None,
+    workers: int = WORKERS,
+    refresh: bool = False,
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     Ejecuta la extracción y devuelve (df_vars, df_studies).
@@ -291,8 +644,11 @@ def run_extraction(
         var_name_regex  -> regex aplicada al nombre
         var_label_regex -> regex aplicada a la etiqueta/label
         file_ids_filter -> limita a variables cuyos file_id intersecten con la lista
+    - workers: descargas de metadatos simultáneas (1 = secuencial).
+    - refresh: vuelve a descargar los metadatos aunque estén en la cache (CACHE_DIR).
     """
-    client = NadaClient()
+    # Sin pool suficiente, urllib3 descarta conexiones y cada descarga extra repite el handshake TLS
+    client = NadaClient(refresh=refresh, pool_size=max(POOL_SIZE, workers))
 
     if sid_list:
         study_ids = [int(x) for x in sid_list]
@@ -306,60 +662,40 @@ def run_extraction(
     if not study_ids:
         raise RuntimeError("No se encontraron estudios con los parámetros dados.")
 
-    all_vars: List[Dict[str, Any]] = []
-    all_studies: List[Dict[str, Any]] = []
-
-    name_set = {s.lower() for s in var_names} if var_names else None
-    name_rx = re.compile(var_name_regex, flags=re.IGNORECASE) if var_name_regex else None
-    lab_rx  = re.compile(var_label_regex,  flags=re.IGNORECASE) if var_label_regex  else None
-    file_set = set(file_ids_filter) if file_ids_filter else None
-
-    for sid in study_ids:
-        md = client.export_metadata(sid)
-
-        # Estudio
-        all_studies.append(parse_study(md, sid))
-
-        # Variables (sin filtrar)
-        rows = parse_variables(md, sid)
-
-        # Aplicar filtros (si los hay)
-        out_rows: List[Dict[str, Any]] = []
-        for r in rows:
-            ok = True
-            if name_set is not None:
-                ok = (r["var_name"] or "").lower() in name_set
-            if ok and name_rx:
-                ok = bool(name_rx.search(r["var_name"] or ""))
-            if ok and lab_rx:
-                ok = bool(lab_rx.search(r["var_label"] or ""))
-            if ok and file_set:
-                # file_ids es string "1;3;5" o None
-                ids = [int(x) for x in (r.get("file_ids") or "").split(";") if x.isdigit()]
-                ok = bool(set(ids) & file_set)
-            if ok:
-                out_rows.append(r)
-
-        all_vars.extend(out_rows)
-
-    # DataFrames
-    df_vars = pd.DataFrame(all_vars, columns=[
-        "study_id","study_title","var_id","var_name","var_label","var_type",
-        "var_dcml","var_intrvl","var_wgt","file_ids","file_names",
-        "universe","q_preqtext","q_qstnlit","q_postqtxt","notes",
-        "n_categories","categories_json"
-    ])
-    df_studies = pd.DataFrame(all_studies, columns=[
-        "study_id","idno","title","sub_title","nation","abbreviation",
-        "year_start","year_end","proddate","repositoryid","version",
-        "abstract","data_kind","geog_coverage","universe_study",
-        "keywords","topics","producers","funding",
-        "access_policy","confidentiality","conditions","disclaimer",
-        "citation_requirement","doi"
-    ])
+    cols_vars: Dict[str, List[Any]] = {c: [] for c in VAR_COLUMNS}
+    cols_studies: Dict[str, List[Any]] = {c: [] for c in STUDY_COLUMNS}
+
+    filters = dict(
+        name_set={s.lower() for s in var_names} if var_names else None,
+        name_rx=re.compile(var_name_regex, flags=re.IGNORECASE) if var_name_regex else None,
+        lab_rx=re.compile(var_label_regex, flags=re.IGNORECASE) if var_label_regex else None,
+        file_set=set(file_ids_filter) if file_ids_filter else None,
+    )
+
+    # Descarga + parseo concurrentes (con ijson el JSON se procesa en streaming);
+    # ex.map conserva el orden de study_ids. Los filtros se aplican dentro del parseo.
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        for st, part in ex.map(partial(_fetch_and_parse, client, **filters), study_ids):
+            for c in STUDY_COLUMNS:
+                cols_studies[c].append(st[c])
+            for c in VAR_COLUMNS:
+                cols_vars[c].extend(part[c])
+
+    cols_vars["categories_json"] = _dump_categories(cols_vars["categories_json"])
+
+    # DataFrames (columnares: sin transponer filas dict -> columnas); texto y enteros
+    # con tipos Arrow fijos (menos memoria, to_parquet sin conversión, mismo esquema siempre)
+    df_vars = _typed_frame(cols_vars, VAR_DTYPES)
+    df_studies = _typed_frame(cols_studies, STUDY_DTYPES)
     return df_vars, df_studies
 
 
+def _write_parquet(df: pd.DataFrame, path: str) -> None:
+    """Parquet vía pyarrow: zstd + diccionario (nation, var_type, file_ids... se repiten mucho)."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, path, compression="zstd", use_dictionary=True, row_group_size=64_000)
+
+
 # ==================================================
 # CLI 
 # ==================================================
@@ -374,6 +710,8 @@ def _main():
     ap.add_argument("--limit-studies", type=int, default=25)
     ap.add_argument("--page-size", type=int, default=100)
     ap.add_argument("--max-pages", type=int, default=10)
+    ap.add_argument("--workers", type=int, default=WORKERS, help="Descargas de metadatos en paralelo")
+    ap.add_argument("--refresh", action="store_true", help="Ignorar la cache de metadatos y volver a descargar")
 
     # Filtros de variables
     ap.add_argument("--vars", type=str, help="Nombres exactos de variables (coma)")
@@ -412,6 +750,8 @@ def _main():
         var_name_regex=args.var_name_regex,
         var_label_regex=args.var_label_regex,
         file_ids_filter=file_ids,
+        workers=args.workers,
+        refresh=args.refresh,
     )
 
     # Guardar
@@ -419,8 +759,8 @@ def _main():
         df_vars.to_csv(args.out_vars if args.out_vars.endswith(".csv") else args.out_vars.replace(".parquet", ".csv"), index=False)
         df_studies.to_csv(args.out_studies if args.out_studies.endswith(".csv") else args.out_studies.replace(".parquet", ".csv"), index=False)
     else:
-        df_vars.to_parquet(args.out_vars if args.out_vars.endswith(".parquet") else args.out_vars.replace(".csv", ".parquet"), index=False)
-        df_studies.to_parquet(args.out_studies if args.out_studies.endswith(".parquet") else args.out_studies.replace(".csv", ".parquet"), index=False)
+        _write_parquet(df_vars, args.out_vars if args.out_vars.endswith(".parquet") else args.out_vars.replace(".csv", ".parquet"))
+        _write_parquet(df_studies, args.out_studies if args.out_studies.endswith(".parquet") else args.out_studies.replace(".csv", ".parquet"))
 
     LOG.info("Listo: vars=%s (%d filas) | studies=%s (%d filas)",
              args.out_vars, len(df_vars), args.out_studies, len(df_studies))
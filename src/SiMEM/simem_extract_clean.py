@@ -2,15 +2,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import functools
 import json
+import re
 import sys
-import time
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional
 from urllib.parse import urlencode, quote_plus
 
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:  # opcional: parseo JSON más rápido
+    import orjson
+except ImportError:
+    orjson = None
 
 
 # ==================================================
@@ -60,6 +69,41 @@ PARAMS = {
 }
 
 BASE_URL = "https://www.simem.co/backend-files/api/PublicData"
+STRING_DTYPE = pd.StringDtype("pyarrow")   # texto en buffers Arrow contiguos (no objetos Python)
+USER_AGENT = "simem-extractor/clean-1.0"
+
+
+def _mk_retry(max_retries: int, backoff: float) -> Retry:
+    """`max_retries` = intentos totales (como en PARAMS); backoff exponencial + jitter."""
+    return Retry(
+        total=max(max_retries - 1, 0),
+        backoff_factor=backoff,
+        backoff_jitter=0.25,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _mk_session(max_retries: int, backoff: float) -> requests.Session:
+    """
+    Sesión con keep-alive: reusa TCP/TLS entre reintentos y llamadas. Una por política
+    de reintentos (cacheada): el Retry del adapter queda fijo y no se reasigna por request.
+    """
+    s = requests.Session()
+    s.headers.update({
+        "User-Agent": USER_AGENT,
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, deflate",
+    })
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8,
+                          max_retries=_mk_retry(max_retries, backoff))
+    s.mount("https://", adapter)
+    return s
+
+SESSION = _mk_session(PARAMS["max_retries"], PARAMS["retry_backoff_secs"])
 
 
 # ==================================================
@@ -78,10 +122,19 @@ def _ensure_values_list(values: Optional[Any]) -> Optional[List[str]]:
     return None
 
 
+def _json_loads(raw: bytes) -> Any:
+    """json.loads sobre bytes; usa orjson si está instalado."""
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+_SNAKE_RE1 = re.compile(r"([a-z0-9])([A-Z])")
+_SNAKE_RE2 = re.compile(r"[\s\-\/]+")
+
+
+@functools.lru_cache(maxsize=4096)
 def _snake_case(name: str) -> str:
-    import re
-    s = re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", name)
-    s = re.sub(r"[\s\-\/]+", "_", s)
+    s = _SNAKE_RE1.sub(r"\1_\2", name)
+    s = _SNAKE_RE2.sub("_", s)
     s = s.replace("__", "_")
     return s.lower()
 
@@ -100,18 +153,26 @@ def _build_query(dataset_id: str, start_date: str, end_date: str,
 
 
 def _http_get_with_retries(url: str, timeout: int, max_retries: int, backoff: int) -> requests.Response:
-    last_exc = None
-    for attempt in range(1, max_retries + 1):
-        try:
-            r = requests.get(url, timeout=timeout)
-            if 200 <= r.status_code < 300:
-                return r
-            last_exc = RuntimeError(f"HTTP {r.status_code}: {r.text[:300]}")
-        except Exception as e:
-            last_exc = e
-        if attempt < max_retries:
-            time.sleep(backoff * attempt)
-    raise last_exc
+    """GET por la sesión de esa política (SESSION con PARAMS); urllib3 reintenta 429/5xx y errores de red (respeta Retry-After)."""
+    r = _mk_session(max_retries, backoff).get(url, timeout=timeout)
+    if not 200 <= r.status_code < 300:
+        raise RuntimeError(f"HTTP {r.status_code}: {r.text[:300]}")
+    return r
+
+
+def _records_to_frame(records: List[Dict[str, Any]],
+                      schema_columns: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Registros planos -> DataFrame columna a columna (sin pd.json_normalize) cuando el
+    schema está disponible. Si hay valores anidados o filas con llaves distintas a
+    las de la primera, delega en json_normalize.
+    """
+    if not records or not schema_columns or any(isinstance(v, dict) for v in records[0].values()):
+        return pd.json_normalize(records, sep="_")
+    names = list(records[0])
+    if set().union(*records) - set(names):
+        return pd.json_normalize(records, sep="_")
+    return pd.DataFrame({n: [rec.get(n) for rec in records] for n in names}, copy=False)
 
 
 def _map_types_by_schema(df: pd.DataFrame, schema_columns: List[Dict[str, Any]],
@@ -123,17 +184,25 @@ def _map_types_by_schema(df: pd.DataFrame, schema_columns: List[Dict[str, Any]],
     idx = { _norm(c.get("nameColumn", "")): (c.get("nameColumn"), (c.get("dataType") or "").lower())
             for c in schema_columns if c.get("nameColumn") }
 
-    for col in list(df.columns):
-        key = _norm(col)
-        _, dtype = idx.get(key, (None, None))
+    # Agrupa columnas por tipo en una sola pasada y convierte cada grupo en bloque
+    date_cols, dt_cols, text_cols = [], [], []
+    for col in df.columns:
+        _, dtype = idx.get(_norm(col), (None, None))
         if dtype == "fecha":
-            df[col] = pd.to_datetime(df[col], errors="coerce").dt.date
+            date_cols.append(col)
         elif dtype == "fecha hora":
-            df[col] = pd.to_datetime(df[col], errors="coerce")
+            dt_cols.append(col)
         else:
-            df[col] = df[col].astype("string")
-            if strip_text:
-                df[col] = df[col].str.strip()
+            text_cols.append(col)
+
+    if date_cols:
+        df[date_cols] = df[date_cols].apply(pd.to_datetime, errors="coerce").apply(lambda s: s.dt.date)
+    if dt_cols:
+        df[dt_cols] = df[dt_cols].apply(pd.to_datetime, errors="coerce")
+    if text_cols:
+        # Con STRING_DTYPE, .str.strip() corre pc.utf8_trim_whitespace (kernel Arrow, sin bucle Python)
+        txt = df[text_cols].astype(STRING_DTYPE)
+        df[text_cols] = txt.apply(lambda s: s.str.strip()) if strip_text else txt
 
     if to_snake:
         df = df.rename(columns={c: _snake_case(c) for c in df.columns})
@@ -150,65 +219,92 @@ def _fallback_infer_types(df: pd.DataFrame, to_snake: bool, strip_text: bool) ->
             continue
         # texto seguro
         if df[col].dtype == object:
-            df[col] = df[col].astype("string")
-            if strip_text:
-                df[col] = df[col].str.strip()
+            txt = df[col].astype(STRING_DTYPE)
+            df[col] = txt.str.strip() if strip_text else txt
     if to_snake:
         df = df.rename(columns={c: _snake_case(c) for c in df.columns})
     return df
 
 
-def _apply_client_filters(df: pd.DataFrame,
-                          eq_filters: Dict[str, List[str]],
-                          to_snake: bool) -> pd.DataFrame:
+def _col_index(df: pd.DataFrame) -> Dict[str, str]:
+    """{nombre.lower(): nombre real} del DataFrame (gana la primera coincidencia)."""
+    idx: Dict[str, str] = {}
+    for c in df.columns:
+        idx.setdefault(str(c).lower(), c)
+    return idx
+
+
+def _resolve_col(df: pd.DataFrame, col: str, to_snake: bool,
+                 cols_idx: Dict[str, str]) -> Optional[str]:
+    """Columna efectiva (snake_case si aplica); exacta o, si no, case-insensitive."""
+    col_eff = _snake_case(col) if to_snake else col
+    if col_eff in df.columns:
+        return col_eff
+    return cols_idx.get(col_eff.lower())
+
+
+def _eq_filters_mask(df: pd.DataFrame,
+                     eq_filters: Dict[str, List[str]],
+                     to_snake: bool,
+                     cols_idx: Optional[Dict[str, str]] = None) -> Optional[np.ndarray]:
+    """Máscara AND de los filtros de igualdad/pertenencia (None si no hay filtros)."""
     if not eq_filters:
-        return df
-    res = df
+        return None
+    cols_idx = cols_idx if cols_idx is not None else _col_index(df)
+    final_mask = np.ones(len(df), dtype=bool)
     for col, vals in eq_filters.items():
         vals = [str(v).strip() for v in vals]
-        col_eff = _snake_case(col) if to_snake else col
-        if col_eff not in res.columns:
-            # intenta case-insensitive
-            candidates = [c for c in res.columns if c.lower() == col_eff.lower()]
-            if candidates:
-                col_eff = candidates[0]
-            else:
-                print(f"[WARN] Filtro ignorado: columna '{col}' no encontrada.")
-                continue
-        series = res[col_eff]
-        mask = series.astype(str).str.strip().isin(vals)
-        res = res.loc[mask].copy()
-    return res
-
-
-def _apply_client_date_filter(df: pd.DataFrame,
-                              conf: Dict[str, Optional[str]],
-                              to_snake: bool) -> pd.DataFrame:
+        col_eff = _resolve_col(df, col, to_snake, cols_idx)
+        if col_eff is None:
+            print(f"[WARN] Filtro ignorado: columna '{col}' no encontrada.")
+            continue
+        final_mask &= df[col_eff].astype(str).str.strip().isin(vals).to_numpy()
+    return final_mask
+
+
+def _date_filter_mask(df: pd.DataFrame,
+                      conf: Dict[str, Optional[str]],
+                      to_snake: bool,
+                      cols_idx: Optional[Dict[str, str]] = None) -> Optional[np.ndarray]:
+    """Máscara del rango [start, end] (end inclusivo) sobre conf["date_column"]."""
     if not conf or not conf.get("date_column"):
-        return df
+        return None
+    start = conf.get("start")
+    end = conf.get("end")
+    if not (start or end):
+        return None
     col = conf["date_column"]
-    col_eff = _snake_case(col) if to_snake else col
-    if col_eff not in df.columns:
-        candidates = [c for c in df.columns if c.lower() == col_eff.lower()]
-        if candidates:
-            col_eff = candidates[0]
-        else:
-            print(f"[WARN] Filtro por fecha ignorado: columna '{col}' no encontrada.")
-            return df
+    col_eff = _resolve_col(df, col, to_snake, cols_idx if cols_idx is not None else _col_index(df))
+    if col_eff is None:
+        print(f"[WARN] Filtro por fecha ignorado: columna '{col}' no encontrada.")
+        return None
 
     s = df[col_eff]
     # conviértelo si aún no lo es
-    if not pd.api.types.is_datetime64_any_dtype(s) and not pd.api.types.is_datetime64tz_dtype(s):
+    if not pd.api.types.is_datetime64_any_dtype(s):
         s = pd.to_datetime(s, errors="coerce")
-    start = conf.get("start")
-    end = conf.get("end")
-    mask = pd.Series(True, index=df.index)
+    mask = np.ones(len(df), dtype=bool)
     if start:
-        mask &= s >= pd.to_datetime(start)
+        mask &= (s >= pd.to_datetime(start)).to_numpy()
     if end:
         # inclusivo
-        mask &= s <= pd.to_datetime(end) + pd.Timedelta(days=0, hours=23, minutes=59, seconds=59, microseconds=999999)
-    return df.loc[mask].copy()
+        mask &= (s <= pd.to_datetime(end) + pd.Timedelta(days=0, hours=23, minutes=59, seconds=59, microseconds=999999)).to_numpy()
+    return mask
+
+
+def _apply_client_filters(df: pd.DataFrame,
+                          eq_filters: Dict[str, List[str]],
+                          to_snake: bool,
+                          date_conf: Optional[Dict[str, Optional[str]]] = None,
+                          cols_idx: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """Filtros client-side (igualdad + fecha) combinados: una sola copia del frame."""
+    cols_idx = cols_idx if cols_idx is not None else _col_index(df)
+    masks = [m for m in (_eq_filters_mask(df, eq_filters, to_snake, cols_idx),
+                         _date_filter_mask(df, date_conf or {}, to_snake, cols_idx)) if m is not None]
+    if not masks:
+        return df
+    final_mask = np.logical_and.reduce(masks)
+    return df.loc[final_mask].copy()
 
 
 # ==================================================
@@ -245,7 +341,7 @@ def fetch_dataset_and_clean(params: Dict[str, Any]) -> SimemResult:
 
     resp = _http_get_with_retries(url, timeout=timeout, max_retries=max_retries, backoff=backoff)
     try:
-        payload = resp.json()
+        payload = _json_loads(resp.content)
     except Exception:
         raise RuntimeError(f"Respuesta no JSON: {resp.text[:300]}")
 
@@ -257,8 +353,9 @@ def fetch_dataset_and_clean(params: Dict[str, Any]) -> SimemResult:
     schema_columns = result.get("columns") or []
     metadata = {k: v for k, v in result.items() if k not in ("records", "columns")}
 
-    # A veces el dataset devuelve listas anidadas o dicts por fila; normaliza siempre
-    df = pd.json_normalize(records, sep="_")
+    # Registros planos + schema -> construcción columnar; si vienen dicts anidados
+    # por fila se normaliza con json_normalize
+    df = _records_to_frame(records, schema_columns)
 
     # Tipificación
     if schema_columns:
@@ -272,20 +369,22 @@ def fetch_dataset_and_clean(params: Dict[str, Any]) -> SimemResult:
     if drop_dups and not df.empty:
         df = df.drop_duplicates().reset_index(drop=True)
 
-    # Filtros client-side
-    if client_filters:
-        df = _apply_client_filters(df, client_filters, to_snake=to_snake)
-    if client_date_filter and (client_date_filter.get("start") or client_date_filter.get("end")):
-        df = _apply_client_date_filter(df, client_date_filter, to_snake=to_snake)
+    # Índice case-insensitive de columnas (filtros y subset no cambian las columnas)
+    cols_idx = _col_index(df)
+
+    # Filtros client-side (igualdad + fecha en una sola máscara)
+    if client_filters or client_date_filter:
+        df = _apply_client_filters(df, client_filters, to_snake=to_snake,
+                                   date_conf=client_date_filter, cols_idx=cols_idx)
 
     # Subset columnas (después de renombrar)
     if subset_cols:
-        # respeta snake_case si está activado
-        final_cols = [(_snake_case(c) if to_snake else c) for c in subset_cols]
-        missing = [c for c in final_cols if c not in df.columns]
+        # respeta snake_case si está activado; tolera diferencias de mayúsculas
+        resolved = [(c, _resolve_col(df, c, to_snake, cols_idx)) for c in subset_cols]
+        missing = [(_snake_case(c) if to_snake else c) for c, r in resolved if r is None]
         if missing:
             print(f"[WARN] Columnas faltantes en subset: {missing}. Se ignorarán.")
-        keep = [c for c in final_cols if c in df.columns]
+        keep = [r for _, r in resolved if r is not None]
         if keep:
             df = df[keep].copy()
 
@@ -7,9 +7,14 @@ Estandariza dtypes para evitar errores de PyArrow con la columna 'time'.
 """
 
 from __future__ import annotations
-import argparse, logging, os, re, sys, time, glob
+import argparse, csv, logging, os, re, sys, time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Tuple
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
 # ==================================================
 # PARAMS
@@ -21,6 +26,12 @@ SAVE_PARQUET_WIDE   = "banrep_output/catalog/all_wide.parquet"  # None para no g
 SAVE_CSV_LONG       = None                             # Ej: "banrep_output/catalog/all_long.csv"
 SAVE_CSV_WIDE       = None                             # Ej: "banrep_output/catalog/all_wide.csv"
 LOG_LEVEL_DEFAULT   = "INFO"
+WORKERS_DEFAULT     = min(8, os.cpu_count() or 1)          # CSVs leídos en paralelo
+LOW_CARD_COLS       = ("flow_id", "series_name", "currency")  # category al escribir el Parquet largo
+
+# pandas<3 copia todas las columnas en astype salvo copy=False; en pandas 3 (CoW)
+# ya no copia y el kwarg está deprecado
+_NO_COPY = {"copy": False} if int(pd.__version__.split(".")[0]) < 3 else {}
 
 # ==================================================
 ## Logger sin duplicados
@@ -64,75 +75,186 @@ def _snake(s: str) -> str:
 @log_call
 def list_available_flows(out_dir: str) -> List[str]:
     data_dir = os.path.join(out_dir, "data")
-    files = glob.glob(os.path.join(data_dir, "*.csv"))
-    flows = sorted([os.path.splitext(os.path.basename(p))[0] for p in files])
+    # scandir: sin fnmatch ni stat aparte por archivo (ocultos fuera, como en glob)
+    try:
+        with os.scandir(data_dir) as it:
+            flows = sorted(e.name[:-4] for e in it
+                           if e.name.endswith(".csv") and not e.name.startswith(".") and e.is_file())
+    except FileNotFoundError:
+        flows = []
     logger.info("Encontré %s CSV en %s", len(flows), data_dir)
     return flows
 
+# Largo (en dígitos) de 'time' -> formato de fecha
+_TIME_FORMATS = ((8, "%Y%m%d"), (6, "%Y%m"), (4, "%Y"))
+# Trimestral: 2020-Q1, 2020Q1, 2020 q1
+_QUARTER_RX = r"^\s*(\d{4})\s*-?\s*[Qq]([1-4])\s*$"
+
+def _parse_time(s: pd.Series) -> pd.Series:
+    """
+    'time' -> datetime según el largo en dígitos (8: %Y%m%d, 6: %Y%m, 4: %Y), o
+    inicio de trimestre para 'YYYY-Qn'. Lo demás queda NaT.
+    Trabaja sobre los valores únicos (las series de un flow comparten fechas) y
+    cada formato solo parsea sus filas: una pasada por formato, sin reintentos.
+    """
+    codes, uniq = pd.factorize(s)
+    uniq = pd.Series(uniq, dtype="string")
+    quarter = uniq.str.extract(_QUARTER_RX)
+    is_q = quarter[0].notna().to_numpy()
+    digits = uniq.str.replace(r"[^0-9]", "", regex=True)
+    lens = digits.str.len().to_numpy(dtype="float64", na_value=np.nan)
+    lens[is_q] = np.nan
+    parts = [pd.to_datetime(digits[lens == n], format=fmt, errors="coerce", cache=True)
+             for n, fmt in _TIME_FORMATS if (lens == n).any()]
+    if is_q.any():
+        q = quarter[is_q]
+        periods = pd.PeriodIndex((q[0] + "Q" + q[1]).tolist(), freq="Q")
+        parts.append(pd.Series(periods.to_timestamp(), index=q.index))
+    if not parts:
+        return pd.to_datetime(pd.Series(pd.NaT, index=s.index))
+    parsed = pd.concat(parts).reindex(digits.index).to_numpy()
+    out = parsed[codes]
+    out[codes < 0] = np.datetime64("NaT")
+    return pd.Series(out, index=s.index)
+
+# Nulos como en pd.read_csv (pyarrow.csv no trata "" ni "None" como nulo por defecto)
+_NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+              "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+# Columnas clave (en este orden al inicio) y su tipo Arrow; el resto viaja como string
+_KEY_TYPES = {"date": pa.timestamp("us"), "time": pa.string(), "value": pa.float64(),
+              "series_name": pa.string(), "flow_id": pa.string()}
+
+def _csv_header(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return next(csv.reader(f), [])
+
+def _read_csv_pandas(path: str) -> pa.Table:
+    """Lectura tolerante con pandas (filas cortas -> NaN); todas las columnas como string."""
+    df = pd.read_csv(path, dtype=str, encoding="utf-8-sig")
+    return pa.table({c: pa.array(df[c], type=pa.string(), from_pandas=True) for c in df.columns})
+
+def _read_flow_table(path: str, flow_id: Optional[str] = None, sort: bool = False) -> pa.Table:
+    """
+    CSV de un flow -> pa.Table con esquema homogéneo entre flows (concat_tables sin
+    conflictos de tipos): date timestamp[us], value float64, todo lo demás string tal
+    como viene en el CSV. `flow_id` (si se pasa) reemplaza al del archivo; `sort`
+    ordena por (date, time). Filas con menos campos que el encabezado (campos finales
+    omitidos) se aceptan como en pd.read_csv: lo que falta queda nulo.
+    """
+    header = _csv_header(path)
+    # 'value' (u OBS_VALUE si no hay 'value') se deja a la inferencia numérica de Arrow
+    value_src = "value" if "value" in header else ("OBS_VALUE" if "OBS_VALUE" in header else None)
+    conv = pacsv.ConvertOptions(
+        column_types={c: pa.string() for c in header if c != value_src},
+        null_values=_NA_VALUES, strings_can_be_null=True,
+    )
+    try:
+        tbl = pacsv.read_csv(path, convert_options=conv)
+    except pa.ArrowInvalid as e:
+        # pyarrow rechaza filas cortas; pandas las completa con NaN (value pasa por to_numeric)
+        logger.warning("%s: %s. Leo ese archivo con pandas.", os.path.basename(path), e)
+        tbl = _read_csv_pandas(path)
+    n = tbl.num_rows
+    cols = dict(zip(tbl.column_names, tbl.columns))
+
+    if flow_id is not None or "flow_id" not in cols:
+        cols["flow_id"] = pa.nulls(n, pa.string()).fill_null(flow_id or os.path.splitext(os.path.basename(path))[0])
+
+    # 'date': del CSV, o construida desde 'time'
+    if "date" in cols:
+        cols["date"] = pd.to_datetime(cols["date"].to_pandas(), errors="coerce")
+    elif "time" in cols:
+        time_s = cols["time"].to_pandas()
+        cols["date"] = _parse_time(time_s)
+        n_bad = int((cols["date"].isna() & time_s.notna()).sum())
+        if n_bad:
+            logger.warning("%s: %d valores de 'time' sin formato reconocido (date=NaT)",
+                           flow_id or os.path.splitext(os.path.basename(path))[0], n_bad)
+
+    if value_src == "OBS_VALUE":
+        cols["value"] = cols.pop("OBS_VALUE")
+    if "value" in cols and not pa.types.is_floating(cols["value"].type):
+        v = cols["value"]
+        if pa.types.is_integer(v.type) or pa.types.is_null(v.type):
+            cols["value"] = v.cast(pa.float64())
+        else:
+            cols["value"] = pd.to_numeric(v.to_pandas(), errors="coerce")
+
+    out = {}
+    for c, typ in _KEY_TYPES.items():
+        col = cols.pop(c, None)
+        if col is None:
+            out[c] = pa.nulls(n, typ)
+        elif isinstance(col, pd.Series):
+            out[c] = pa.array(col, from_pandas=True).cast(typ)
+        else:
+            out[c] = col.cast(typ)
+    out.update(cols)
+    tbl = pa.table(out)
+    return tbl.sort_by([("date", "ascending"), ("time", "ascending")]) if sort else tbl
+
 @log_call
 def load_one_flow_csv(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
-    # Asegura 'flow_id'
-    if "flow_id" not in df.columns:
-        df["flow_id"] = os.path.splitext(os.path.basename(path))[0]
-
-    # Construye 'date' si falta
-    if "date" not in df.columns and "time" in df.columns:
-        s = df["time"].astype(str)
-        cleaned = s.str.replace(r"[^0-9]", "", regex=True)
-        dt = pd.to_datetime(cleaned, format="%Y%m%d", errors="coerce")
-        if dt.isna().all():
-            dt = pd.to_datetime(cleaned, format="%Y%m", errors="coerce")
-        if dt.isna().all():
-            dt = pd.to_datetime(cleaned, format="%Y", errors="coerce")
-        df["date"] = dt
-
-    # Asegura columnas clave
-    for must in ("time","date","value","series_name","flow_id"):
-        if must not in df.columns:
-            if must == "value" and "OBS_VALUE" in df.columns:
-                df["value"] = df["OBS_VALUE"]
-            else:
-                df[must] = pd.NA
-    return df
+    """Un CSV de flow -> DataFrame con columnas clave (date, time, value, series_name, flow_id)."""
+    return _read_flow_table(path).to_pandas()
 
 def _enforce_schema_strings(df: pd.DataFrame) -> pd.DataFrame:
     """
     Estandariza tipos para parquet:
-    - date -> datetime64[ns]
+    - date -> datetime64 (us desde _read_flow_table: sin desborde de ns en fechas lejanas)
     - value -> float64
     - time, flow_id, series_name, *_code, *_name y demás -> string (no object)
+    No modifica `df`: copia superficial (cada columna convertida se reemplaza, el resto
+    se comparte sin duplicar datos). Si ya viene tipado, devuelve `df` tal cual.
     """
-    out = df.copy()
-
-    if "date" in out.columns:
+    fix_date = "date" in df.columns and not pd.api.types.is_datetime64_dtype(df["date"])
+    fix_value = "value" in df.columns and not pd.api.types.is_float_dtype(df["value"])
+    # Todo lo que no sea date/value -> string (un solo astype; "string" evita NaN -> 'nan').
+    # 'time' incluida: MUY IMPORTANTE que sea string, evita que PyArrow intente int64.
+    # Solo se salta lo que ya es StringDtype (pandas 3 desde Arrow); en pandas 2 llega
+    # como object y sí se convierte
+    to_string = [
+        c for c in df.columns
+        if c not in ("date", "value") and not isinstance(df[c].dtype, pd.StringDtype)
+    ]
+    if not (fix_date or fix_value or to_string):
+        return df
+
+    out = df.copy(deep=False)
+    if fix_date:
         out["date"] = pd.to_datetime(out["date"], errors="coerce")
-
-    if "value" in out.columns:
+    if fix_value:
         out["value"] = pd.to_numeric(out["value"], errors="coerce")
-
-    if "time" in out.columns:
-        # MUY IMPORTANTE: mantener como string, evita que PyArrow intente int64
-        out["time"] = out["time"].astype("string")
-
-    # Todo lo que no sea date/value -> string
-    for c in out.columns:
-        if c in ("date", "value"):
-            continue
-        if pd.api.types.is_categorical_dtype(out[c]):
-            out[c] = out[c].astype("string")
-        elif not pd.api.types.is_string_dtype(out[c]):
-            # evita convertir NaN a 'nan'
-            out[c] = out[c].astype("string")
+    if to_string:
+        out = out.astype({c: "string" for c in to_string}, **_NO_COPY)
 
     return out
 
+def _wide_key(df: pd.DataFrame) -> pd.Categorical:
+    """
+    Columna del ancho "FLOW_ID :: series_name" ("series" si falta) como category:
+    las etiquetas se arman solo para los pares (flow, serie) distintos y el pivot
+    agrupa por códigos enteros en vez de strings.
+    """
+    flow = pd.Categorical(df["flow_id"])
+    series = pd.Categorical(df["series_name"].astype("string").fillna("series"))
+    k = len(series.categories)
+    codes, pairs = pd.factorize(flow.codes.astype(np.int64) * k + series.codes)
+    labels = flow.categories[pairs // k].astype("string") + " :: " + series.categories[pairs % k].astype("string")
+    cat = pd.Categorical.from_codes(codes, categories=labels.astype(str))
+    return cat.reorder_categories(cat.categories.sort_values())
+
 def _safe_to_parquet(df: pd.DataFrame, path: Optional[str]) -> Optional[str]:
     if not path:
         return None
     try:
         os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-        df.to_parquet(path, index=False)  # engine=pyarrow por defecto
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # zstd + diccionario (flow_id/series_name se repiten); BYTE_STREAM_SPLIT en floats
+        floats = [f.name for f in table.schema if pa.types.is_floating(f.type)]
+        pq.write_table(table, path, compression="zstd", compression_level=3, use_dictionary=True,
+                       use_byte_stream_split=floats or False, row_group_size=1_048_576,
+                       data_page_size=1 << 20, write_statistics=True)
         logger.info("Guardado Parquet → %s", path)
         return path
     except Exception as e:
@@ -154,60 +276,82 @@ def consolidate(
     save_parquet_wide: Optional[str] = SAVE_PARQUET_WIDE,
     save_csv_long: Optional[str] = SAVE_CSV_LONG,
     save_csv_wide: Optional[str] = SAVE_CSV_WIDE,
+    workers: int = WORKERS_DEFAULT,
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
     data_dir = os.path.join(out_dir, "data")
-    if flows is None or flows == [] or (isinstance(flows, str) and flows.upper() == "ALL"):
+    listed = flows is None or flows == [] or (isinstance(flows, str) and flows.upper() == "ALL")
+    if listed:
         flows = list_available_flows(out_dir)
     else:
         flows = [str(f).strip() for f in flows if str(f).strip()]
     if not flows:
         raise RuntimeError("No hay variables para consolidar (revisa out_dir/data o la lista de flows).")
 
-    # Carga y concatena (largo)
-    dfs = []
+    # Carga y concatena (largo) en Arrow: concat_tables no copia columnas y
+    # pandas se materializa una sola vez, ya ordenado
+    todo = []
     for fid in flows:
         path = os.path.join(data_dir, f"{fid}.csv")
-        if not os.path.exists(path):
+        # Los listados desde data_dir ya existen; solo se verifica una lista explícita
+        if not listed and not os.path.exists(path):
             logger.warning("No existe CSV para %s (omito). Esperado: %s", fid, path)
             continue
-        df = load_one_flow_csv(path)
-        df["flow_id"] = fid
-        # Orden de columnas
-        first = [c for c in ("date","time","value","series_name","flow_id") if c in df.columns]
-        rest  = [c for c in df.columns if c not in first]
-        df = df[first + rest]
-        dfs.append(df)
-
-    if not dfs:
+        todo.append((path, fid))
+    # Orden (flow_id, date, time): flow_id es constante por archivo, así que basta
+    # ordenar los archivos por flow_id y cada tabla por (date, time) en su hilo,
+    # en vez de un sort global de 3 llaves (flows repetidos: sort global)
+    per_flow = len({fid for _, fid in todo}) == len(todo)
+    # Lecturas en paralelo (el parser de pyarrow libera el GIL); map conserva el orden
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo) or 1))) as ex:
+        tables = list(ex.map(lambda pf: _read_flow_table(*pf, sort=per_flow), todo))
+
+    if not tables:
         raise RuntimeError("No se pudo cargar ningún CSV. ¿Ruta correcta y permisos?")
 
-    df_long = pd.concat(dfs, ignore_index=True).sort_values(["flow_id","date","time"]).reset_index(drop=True)
+    # Columnas extra en orden de aparición según `flows` (como un concat sin ordenar)
+    columns = list(dict.fromkeys(c for t in tables for c in t.column_names))
+    if per_flow:
+        tables = [t for _, t in sorted(zip((fid for _, fid in todo), tables), key=lambda x: x[0])]
+    big = pa.concat_tables(tables, promote_options="default").select(columns)
+    if not per_flow:
+        # sort_by = sort_indices + take en una pasada; to_pandas deja RangeIndex (sin reset_index)
+        big = big.sort_by([("flow_id", "ascending"), ("date", "ascending"), ("time", "ascending")])
+    df_long = big.to_pandas(self_destruct=True)
+    del big, tables
 
     # Tipado seguro antes de guardar
     df_long = _enforce_schema_strings(df_long)
 
     # Ancho
-    tmp = df_long.copy()
-    tmp["_col_"] = tmp.apply(
-        lambda r: f"{r['flow_id']} :: {r['series_name']}" if pd.notna(r.get("series_name")) else f"{r['flow_id']} :: series",
-        axis=1
-    )
-    idx = "date" if "date" in tmp.columns else "time"
-    df_wide = tmp.pivot_table(index=idx, columns="_col_", values="value", aggfunc="first").sort_index().reset_index()
+    # Solo las 3 columnas que usa el pivot (sin copiar df_long completo)
+    idx = "date" if "date" in df_long.columns else "time"
+    tmp = pd.DataFrame({idx: df_long[idx], "value": df_long["value"], "_col_": _wide_key(df_long)}, copy=False)
+    # pivot (reindex directo) sobre claves ya únicas: equivale a pivot_table(aggfunc="first"),
+    # que toma el primer valor no nulo y omite claves nulas, sin pasar por groupby
+    keys = tmp.dropna(subset=["value", idx]).drop_duplicates([idx, "_col_"], keep="first")
+    keys["_col_"] = keys["_col_"].cat.remove_unused_categories()
+    try:
+        df_wide = keys.pivot(index=idx, columns="_col_", values="value")
+    except ValueError:
+        df_wide = tmp.pivot_table(index=idx, columns="_col_", values="value", aggfunc="first", observed=True)
+    df_wide = df_wide.sort_index().reset_index()
 
     # También tipa seguro el ancho (date dt64, resto float/string)
     if "date" in df_wide.columns:
         df_wide["date"] = pd.to_datetime(df_wide["date"], errors="coerce")
-    for c in df_wide.columns:
-        if c == "date":
-            continue
-        # columnas de series deben ser numéricas (o NaN)
-        if c != "time":
-            df_wide[c] = pd.to_numeric(df_wide[c], errors="coerce")
+    # columnas de series deben ser numéricas (o NaN); el pivot ya las deja float,
+    # así que solo se convierten las que no lo sean
+    no_float = [c for c, t in df_wide.dtypes.items()
+                if c not in ("date", "time") and not pd.api.types.is_float_dtype(t)]
+    if no_float:
+        df_wide[no_float] = df_wide[no_float].apply(pd.to_numeric, errors="coerce")
 
     # Guardar
     os.makedirs(os.path.join(out_dir, "catalog"), exist_ok=True)
-    _safe_to_parquet(df_long, save_parquet_long)
+    # Claves muy repetidas como category solo para escribir: Arrow las pasa como
+    # DictionaryArray (códigos + únicos) en vez de una string por fila; df_long sigue en string
+    low_card = {c: "category" for c in LOW_CARD_COLS if c in df_long.columns}
+    _safe_to_parquet(df_long.astype(low_card, **_NO_COPY) if save_parquet_long and low_card else df_long, save_parquet_long)
     _safe_to_parquet(df_wide, save_parquet_wide)
     if save_csv_long:
         df_long.to_csv(save_csv_long, index=False); logger.info("Guardado CSV → %s", save_csv_long)
@@ -230,6 +374,7 @@ def build_cli() -> argparse.ArgumentParser:
     p.add_argument("--save-parquet-wide", default=SAVE_PARQUET_WIDE)
     p.add_argument("--save-csv-long", default=SAVE_CSV_LONG)
     p.add_argument("--save-csv-wide", default=SAVE_CSV_WIDE)
+    p.add_argument("--workers", type=int, default=WORKERS_DEFAULT, help="CSVs leídos en paralelo")
     p.add_argument("--log", default=LOG_LEVEL_DEFAULT, help="DEBUG|INFO|WARNING|ERROR")
     return p
 
@@ -266,6 +411,7 @@ def main(argv=None):
         save_parquet_wide=args.save_parquet_wide or None,
         save_csv_long=args.save_csv_long or None,
         save_csv_wide=args.save_csv_wide or None,
+        workers=args.workers,
     )
 
     # Variables en el entorno interactivo (si usas python -i)
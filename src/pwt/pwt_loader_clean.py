@@ -7,28 +7,34 @@ Carga Penn World Table (PWT 11.x) desde Dataverse (por DOI), normaliza y genera:
 - wide_panel   : igual a pwt_main (tras filtros, si aplica)
 
 Uso como librería:
-    from pwt_loader_clean import load_pwt, export_csv
+    from pwt_loader_clean import load_pwt, export_pwt
     pwt_main, vista_figura, wide_panel = load_pwt(out_dir="pwt_out")
-    export_csv(pwt_main, vista_figura, wide_panel, "pwt_out")
+    export_pwt(pwt_main, vista_figura, wide_panel, "pwt_out")                      # Parquet
+    export_pwt(pwt_main, vista_figura, wide_panel, "pwt_out", formats=("csv",))    # CSV
 
 Uso como script (y quedarte con variables):
     python -i pwt_loader_clean.py  # entra a modo interactivo con los df en memoria
 
-Requiere: pandas, requests, openpyxl (xlsx), pyreadstat (opcional para .dta)
+Requiere: pandas, pyarrow, requests, openpyxl (xlsx), pyreadstat (opcional para .dta)
 """
 from __future__ import annotations
 
 import hashlib
-import io
+import inspect
+import json
 import logging
 import os
 import re
 import sys
-from dataclasses import dataclass
+import time
+from dataclasses import asdict, dataclass
+from email.utils import formatdate
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -39,6 +45,14 @@ DOI  = "doi:10.34894/FABVLR"  # PWT 11.x
 TIMEOUT = (10, 180)           # (connect, read) seconds
 USER_AGENT = "pwt-loader/clean-1.0"
 API_TOKEN = os.getenv("DATAVERSE_API_TOKEN", "").strip()
+META_TTL = int(os.getenv("PWT_META_TTL", "86400"))  # seg. que vale el listado de archivos cacheado
+META_FILE = ".pwt_meta.json"                         # listado cacheado (en out_dir)
+CHUNK = 1 << 20                                      # bloque de descarga / md5
+EXPORT_FORMATS = ("parquet",)                        # default de export_pwt: "parquet" y/o "csv"
+
+# pandas>=2.1: stack nuevo (el legacy da FutureWarning en 2.x); no descarta NaN, de eso
+# se encargan los dropna de _build_views
+_STACK_KW = {"future_stack": True} if "future_stack" in inspect.signature(pd.DataFrame.stack).parameters else {}
 
 # -------------------- Logger (sin duplicados) --------------------
 logger = logging.getLogger("pwt_loader")
@@ -156,9 +170,17 @@ SESSION = _mk_session()
 def _safe_name(name: str) -> str:
     return re.sub(r"[^\w\-.]+", "_", name.strip())
 
-def list_files_latest_published(base: str, persistent_id: str) -> List[FileMeta]:
+def list_files_latest_published(base: str, persistent_id: str,
+                                 if_modified_since: Optional[float] = None) -> Optional[List[FileMeta]]:
+    """
+    Archivos de la última versión publicada. Con `if_modified_since` (epoch) envía
+    If-Modified-Since y devuelve None si el server responde 304 (sin cambios).
+    """
     url = f"{base}/api/datasets/:persistentId/versions/:latest-published/files"
-    r = SESSION.get(url, params={"persistentId": persistent_id}, timeout=TIMEOUT)
+    headers = {"If-Modified-Since": formatdate(if_modified_since, usegmt=True)} if if_modified_since else None
+    r = SESSION.get(url, params={"persistentId": persistent_id}, timeout=TIMEOUT, headers=headers)
+    if r.status_code == 304:
+        return None
     try:
         r.raise_for_status()
     except requests.HTTPError as e:
@@ -170,46 +192,66 @@ def list_files_latest_published(base: str, persistent_id: str) -> List[FileMeta]
     data = js.get("data")
     if not isinstance(data, list):
         raise DataverseError("Estructura inesperada en la respuesta de Dataverse.")
-    metas: List[FileMeta] = []
-    for item in data:
-        df = item.get("dataFile") or {}
-        if "id" not in df:
-            continue
-        checksum = None
-        if isinstance(df.get("checksum"), dict):
-            checksum = df["checksum"].get("value")
-        metas.append(FileMeta(
+    # Una sola comprensión; walrus evita repetir .get("dataFile") / .get("checksum")
+    metas: List[FileMeta] = [
+        FileMeta(
             id=int(df["id"]),
             label=item.get("label", "unknown"),
             content_type=df.get("contentType", "") or "",
             size=df.get("filesize"),
-            checksum=checksum
-        ))
+            checksum=ck.get("value") if isinstance(ck := df.get("checksum"), dict) else None,
+        )
+        for item in data
+        if (df := item.get("dataFile")) and "id" in df
+    ]
     logger.info("Archivos en la versión publicada: %d", len(metas))
     return metas
 
-def download_file_by_id(base: str, file_id: int, original: bool = True) -> bytes:
+def _md5_file(path: Path) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def download_file_by_id(base: str, file_id: int, dest: Path, original: bool = True) -> str:
+    """
+    Descarga en streaming a `dest` (vía .part + rename, memoria constante) y devuelve
+    el md5 calculado en la misma pasada.
+    """
     url = f"{base}/api/access/datafile/{file_id}"
     params = {"format": "original"} if original else {}
     r = SESSION.get(url, params=params, timeout=TIMEOUT, stream=True)
     try:
         r.raise_for_status()
     except requests.HTTPError:
+        r.close()
         if original:
             logger.warning("Fallo con format=original; reintentando sin formato…")
-            return download_file_by_id(base, file_id, original=False)
+            return download_file_by_id(base, file_id, dest, original=False)
         raise
-    return r.content
+    dest = Path(dest)
+    tmp = dest.with_name(dest.name + ".part")
+    md5 = hashlib.md5()
+    try:
+        with r, open(tmp, "wb") as f:
+            for chunk in r.iter_content(CHUNK):
+                f.write(chunk)
+                md5.update(chunk)
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return md5.hexdigest()
 
 # -------------------- Lectores --------------------
-def _read_excel_main_sheet(raw: bytes) -> pd.DataFrame:
-    xls = pd.ExcelFile(io.BytesIO(raw))
-    sheet = "Data" if "Data" in xls.sheet_names else xls.sheet_names[0]
-    logger.info("Excel → usando hoja: %s", sheet)
-    return pd.read_excel(xls, sheet_name=sheet)
+def _read_excel_main_sheet(path: Path) -> pd.DataFrame:
+    with pd.ExcelFile(path) as xls:  # cierra el archivo (si no, queda tomado y falla un os.replace posterior)
+        sheet = "Data" if "Data" in xls.sheet_names else xls.sheet_names[0]
+        logger.info("Excel → usando hoja: %s", sheet)
+        return pd.read_excel(xls, sheet_name=sheet)
 
-def _read_stata(raw: bytes) -> pd.DataFrame:
-    return pd.read_stata(io.BytesIO(raw))
+def _read_stata(path: Path) -> pd.DataFrame:
+    return pd.read_stata(path)
 
 # -------------------- Core --------------------
 def _prefer_main_file(metas: List[FileMeta]) -> Tuple[Optional[FileMeta], Optional[FileMeta]]:
@@ -217,19 +259,50 @@ def _prefer_main_file(metas: List[FileMeta]) -> Tuple[Optional[FileMeta], Option
     xls = next((m for m in metas if re.match(r"^pwt\d+\.xlsx$", m.label, re.I)), None)
     return dta, xls
 
-def _maybe_use_cache(out_dir: Path, meta: FileMeta) -> Optional[bytes]:
+def _load_meta_cache(out_dir: Path, base: str, doi: str) -> Tuple[Optional[List[FileMeta]], Optional[float]]:
+    """(metas, mtime) del listado cacheado para base/doi; (None, None) si no hay o no calza."""
+    p = out_dir / META_FILE
+    try:
+        js = json.loads(p.read_text(encoding="utf-8"))
+        if js.get("base") != base or js.get("doi") != doi:
+            return None, None
+        return [FileMeta(**m) for m in js["files"]], p.stat().st_mtime
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, None
+
+def _save_meta_cache(out_dir: Path, base: str, doi: str, metas: List[FileMeta]) -> None:
+    p = out_dir / META_FILE
+    p.write_text(json.dumps({"base": base, "doi": doi, "files": [asdict(m) for m in metas]}), encoding="utf-8")
+
+def _list_files_cached(out_dir: Path, base: str, doi: str, use_cache: bool) -> List[FileMeta]:
+    """
+    Listado de archivos con cache en out_dir: dentro de META_TTL no hay request;
+    vencido, se revalida con If-Modified-Since (304 -> se reusa y se renueva el TTL).
+    """
+    cached, mtime = _load_meta_cache(out_dir, base, doi) if use_cache else (None, None)
+    if cached is not None and time.time() - mtime < META_TTL:
+        logger.info("Listado de archivos desde cache (%s).", META_FILE)
+        return cached
+    metas = list_files_latest_published(base, doi, if_modified_since=mtime)
+    if metas is None:
+        logger.info("Listado sin cambios (304); reuso %s.", META_FILE)
+        (out_dir / META_FILE).touch()
+        return cached
+    _save_meta_cache(out_dir, base, doi, metas)
+    return metas
+
+def _maybe_use_cache(out_dir: Path, meta: FileMeta) -> Optional[Path]:
     p = out_dir / _safe_name(meta.label)
     if not p.exists():
         return None
     if meta.checksum:
-        md5 = hashlib.md5(p.read_bytes()).hexdigest()
-        if md5 == meta.checksum:
+        if _md5_file(p) == meta.checksum:
             logger.info("Cache OK para %s (md5 coincide).", meta.label)
-            return p.read_bytes()
+            return p
         logger.info("Cache desactualizada para %s (md5 no coincide).", meta.label)
         return None
     logger.info("Cache encontrada para %s (sin checksum remoto).", meta.label)
-    return p.read_bytes()
+    return p
 
 def _normalize_panel(df: pd.DataFrame) -> pd.DataFrame:
     cols = {c.lower(): c for c in df.columns}
@@ -250,18 +323,26 @@ def _build_views(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
     keys = {"iso","country","year"}
     var_cols = [c for c in df.columns if c not in keys]
     # wide_panel
-    wide_panel = df.copy()
-    # vista_figura (años como columnas)
-    long = df.melt(id_vars=["iso","country","year"],
-                   value_vars=var_cols,
-                   var_name="variable_code", value_name="value")
-    long["variable_name"] = long["variable_code"].map(VAR_LABELS).fillna(long["variable_code"])
-    vista_figura = (
-        long.pivot_table(index=["iso","country","variable_code","variable_name"],
-                         columns="year", values="value", aggfunc="first")
-        .reset_index()
-        .sort_values(["iso","variable_code"])
-    )
+    wide_panel = df.copy(deep=False)  # comparte datos con pwt_main (sin duplicar el panel)
+    # vista_figura (años como columnas). (iso, year) es único en PWT: basta con
+    # trasponer variables contra años (stack/unstack), sin el groupby de pivot_table
+    try:
+        panel = df.dropna(subset=["iso","country","year"]).set_index(["iso","country","year"])[var_cols]
+        panel.columns.name = "variable_code"
+        vista_figura = panel.stack(**_STACK_KW).unstack("year").dropna(how="all").dropna(axis=1, how="all").reset_index()
+        codes = vista_figura["variable_code"]
+        vista_figura.insert(3, "variable_name", codes.map(VAR_LABELS).fillna(codes))
+    except ValueError:  # claves repetidas
+        long = df.melt(id_vars=["iso","country","year"],
+                       value_vars=var_cols,
+                       var_name="variable_code", value_name="value")
+        long["variable_name"] = long["variable_code"].map(VAR_LABELS).fillna(long["variable_code"])
+        vista_figura = (
+            long.pivot_table(index=["iso","country","variable_code","variable_name"],
+                             columns="year", values="value", aggfunc="first")
+            .reset_index()
+        )
+    vista_figura = vista_figura.sort_values(["iso","variable_code"])
     meta = ["iso","country","variable_code","variable_name"]
     years = sorted([c for c in vista_figura.columns if isinstance(c,(int,float)) or str(c).isdigit()],
                    key=lambda x: int(x))
@@ -283,23 +364,25 @@ def load_pwt(
     """
     out = Path(out_dir); out.mkdir(parents=True, exist_ok=True)
 
-    metas = list_files_latest_published(base, doi)
+    metas = _list_files_cached(out, base, doi, use_cache)
     dta, xls = _prefer_main_file(metas)
     if not (dta or xls):
         raise DataverseError("No encontré pwt*.dta ni pwt*.xlsx en el dataset.")
     meta = dta or xls
 
-    raw = _maybe_use_cache(out, meta) if use_cache else None
-    if raw is None:
+    path = _maybe_use_cache(out, meta) if use_cache else None
+    if path is None:
         logger.info("Descargando %s ...", meta.label)
-        raw = download_file_by_id(base, meta.id, original=True)
-        (out / _safe_name(meta.label)).write_bytes(raw)
-        logger.info("Guardado archivo crudo en %s", (out / _safe_name(meta.label)).as_posix())
+        path = out / _safe_name(meta.label)
+        md5 = download_file_by_id(base, meta.id, path, original=True)
+        if meta.checksum and md5 != meta.checksum:
+            logger.warning("md5 de %s no coincide con el informado por Dataverse.", meta.label)
+        logger.info("Guardado archivo crudo en %s", path.as_posix())
     else:
         logger.info("Usando archivo desde cache: %s", meta.label)
 
     # leer
-    df = _read_stata(raw) if meta.label.lower().endswith(".dta") else _read_excel_main_sheet(raw)
+    df = _read_stata(path) if meta.label.lower().endswith(".dta") else _read_excel_main_sheet(path)
     df = _normalize_panel(df)
 
     # filtros opcionales
@@ -321,6 +404,45 @@ def load_pwt(
                 *pwt_main.shape, *vista_figura.shape, *wide_panel.shape)
     return pwt_main, vista_figura, wide_panel
 
+def _to_arrow(df: pd.DataFrame) -> pa.Table:
+    """DataFrame -> pa.Table; columnas object mixtas (p. ej. años con currency_unit) van como texto."""
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        obj = df.select_dtypes(include="object").columns
+        return pa.Table.from_pandas(df.astype({c: "string" for c in obj}), preserve_index=False)
+
+def _split_figura(vista_figura: pd.DataFrame, pwt_main: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    vista_figura -> (variables numéricas, variables de texto). Juntas, las de texto
+    (currency_unit, i_*) vuelven object todas las columnas de años; separadas, las
+    numéricas quedan float64 y las de texto string.
+    """
+    meta = ["iso","country","variable_code","variable_name"]
+    years = [c for c in vista_figura.columns if c not in meta]
+    text_vars = [c for c in pwt_main.columns
+                 if c not in ("iso","country","year") and not pd.api.types.is_numeric_dtype(pwt_main[c])]
+    is_text = vista_figura["variable_code"].isin(text_vars)
+    num = vista_figura[~is_text].astype({y: "float64" for y in years})
+    txt = vista_figura[is_text].astype({y: "string" for y in years})
+    return num, txt
+
+def export_parquet(pwt_main: pd.DataFrame, vista_figura: pd.DataFrame, wide_panel: pd.DataFrame, out_dir: str | Path) -> None:
+    """
+    Mismas salidas que export_csv en Parquet (zstd + diccionario: iso/country se repiten).
+    vista_figura se parte por tipo: pwt_view_figura (años float64) y, si hay variables
+    de texto, pwt_view_figura_text (años string).
+    """
+    out = Path(out_dir); out.mkdir(parents=True, exist_ok=True)
+    fig_num, fig_txt = _split_figura(vista_figura, pwt_main)
+    outputs = [(pwt_main, "pwt_main"), (fig_num, "pwt_view_figura"), (wide_panel, "pwt_view_wide")]
+    if len(fig_txt):
+        outputs.append((fig_txt, "pwt_view_figura_text"))
+    for df, name in outputs:
+        pq.write_table(_to_arrow(df), out / f"{name}.parquet", compression="zstd",
+                       use_dictionary=True, row_group_size=262_144)
+    logger.info("Parquet guardados en: %s", out.as_posix())
+
 def export_csv(pwt_main: pd.DataFrame, vista_figura: pd.DataFrame, wide_panel: pd.DataFrame, out_dir: str | Path) -> None:
     out = Path(out_dir); out.mkdir(parents=True, exist_ok=True)
     pwt_main.to_csv(out / "pwt_main.csv", index=False)
@@ -328,11 +450,23 @@ def export_csv(pwt_main: pd.DataFrame, vista_figura: pd.DataFrame, wide_panel: p
     wide_panel.to_csv(out / "pwt_view_wide.csv", index=False)
     logger.info("CSV guardados en: %s", out.as_posix())
 
+def export_pwt(pwt_main: pd.DataFrame, vista_figura: pd.DataFrame, wide_panel: pd.DataFrame,
+               out_dir: str | Path, formats: Tuple[str, ...] = EXPORT_FORMATS) -> None:
+    """Exporta las tres salidas en `formats`: "parquet" (default) y/o "csv"."""
+    formats = (formats,) if isinstance(formats, str) else tuple(formats)
+    unknown = set(formats) - {"parquet", "csv"}
+    if unknown:
+        raise ValueError(f"Formatos no soportados: {sorted(unknown)} (usa 'parquet' y/o 'csv').")
+    if "parquet" in formats:
+        export_parquet(pwt_main, vista_figura, wide_panel, out_dir)
+    if "csv" in formats:
+        export_csv(pwt_main, vista_figura, wide_panel, out_dir)
+
 # -------------------- Ejecución como script --------------------
 if __name__ == "__main__":
     # Ajusta aquí lo que quieras exportar por defecto:
     pwt_main, vista_figura, wide_panel = load_pwt(out_dir="pwt_out", use_cache=True)
-    export_csv(pwt_main, vista_figura, wide_panel, out_dir="pwt_out")
+    export_pwt(pwt_main, vista_figura, wide_panel, out_dir="pwt_out", formats=EXPORT_FORMATS)
 
     # Deja las variables disponibles si ejecutas con `python -i pwt_loader_clean.py`
     import __main__
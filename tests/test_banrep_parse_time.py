@@ -0,0 +1,27 @@
+import pandas as pd
+
+from banrep.banrep_extract_clean_v3 import _parse_time
+
+
+def _parse(values):
+    return _parse_time(pd.Series(values, dtype="object")).tolist()
+
+
+def test_parse_time_por_largo():
+    assert _parse(["20200115", "2020-01-15", "199001", "1990-01", "2020"]) == [
+        pd.Timestamp("2020-01-15"), pd.Timestamp("2020-01-15"),
+        pd.Timestamp("1990-01-01"), pd.Timestamp("1990-01-01"), pd.Timestamp("2020-01-01"),
+    ]
+
+
+def test_parse_time_trimestral():
+    assert _parse(["2020-Q1", "2020Q4", " 2021 q2 ", "2020-Q1"]) == [
+        pd.Timestamp("2020-01-01"), pd.Timestamp("2020-10-01"),
+        pd.Timestamp("2021-04-01"), pd.Timestamp("2020-01-01"),
+    ]
+
+
+def test_parse_time_no_reconocido_y_nulos():
+    out = _parse_time(pd.Series(["2020-Q5", "20201", None, "2020"], index=[10, 11, 12, 13]))
+    assert list(out.index) == [10, 11, 12, 13]
+    assert out.isna().tolist() == [True, True, True, False]
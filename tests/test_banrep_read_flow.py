@@ -0,0 +1,31 @@
+import pandas as pd
+
+from banrep.banrep_extract_clean_v3 import consolidate, load_one_flow_csv
+
+
+def _write_flows(tmp_path, files):
+    data = tmp_path / "data"
+    data.mkdir()
+    for name, text in files.items():
+        (data / f"{name}.csv").write_text(text, encoding="utf-8")
+    return tmp_path
+
+
+def test_fila_corta_queda_con_nulos(tmp_path):
+    # Segunda fila sin el último campo (series_name), como lo deja pd.read_csv
+    out = _write_flows(tmp_path, {"DF_A": "time,value,series_name\n20200101,1,A\n20200102,2\n"})
+    df = load_one_flow_csv(str(out / "data" / "DF_A.csv"))
+    assert df["value"].tolist() == [1.0, 2.0]
+    assert df["series_name"].isna().tolist() == [False, True]
+    assert df["date"].tolist() == [pd.Timestamp("2020-01-01"), pd.Timestamp("2020-01-02")]
+
+
+def test_consolidate_con_fila_corta(tmp_path):
+    out = _write_flows(tmp_path, {
+        "DF_A": "time,value,series_name\n20200101,1,A\n20200102,2\n",
+        "DF_B": "time,value,series_name\n20200101,3,B\n",
+    })
+    df_long, df_wide = consolidate(str(out), save_parquet_long=None, save_parquet_wide=None)
+    assert len(df_long) == 3
+    assert df_long["flow_id"].tolist() == ["DF_A", "DF_A", "DF_B"]
+    assert df_wide.loc[0, "DF_B :: B"] == 3.0
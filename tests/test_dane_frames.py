@@ -0,0 +1,33 @@
+import pandas as pd
+
+from DANE import dane_extract_clean as dane
+
+STUDIES = {
+    1: {"title": "A", "study_desc": {"study_info": {"dates": {"start": 2019}}},
+        "variables": [{"name": "OCUP", "var_wgt": 1, "var_dcml": 0},
+                      {"name": "EDAD", "var_wgt": None, "var_dcml": None}]},
+    2: {"title": "B", "study_desc": {"study_info": {"dates": {"start": None}}}, "variables": []},
+}
+
+
+def _run(monkeypatch, **kwargs):
+    monkeypatch.setattr(dane.NadaClient, "export_metadata", lambda self, sid: STUDIES[sid])
+    monkeypatch.setattr(dane.NadaClient, "stream_metadata",
+                        lambda self, sid: (STUDIES[sid], iter(STUDIES[sid]["variables"])))
+    return dane.run_extraction(sid_list=[1, 2], workers=1, **kwargs)
+
+
+def test_enteros_con_nulos_quedan_como_texto_sin_decimales(monkeypatch):
+    df_vars, df_studies = _run(monkeypatch)
+    assert df_studies["year_start"].tolist() == ["2019", pd.NA]
+    assert df_vars["var_wgt"].tolist() == ["1", pd.NA]
+    assert df_vars["var_dcml"].tolist() == ["0", pd.NA]
+    # Mismo valor con o sin filtros (no depende de las demás filas)
+    filtered, _ = _run(monkeypatch, var_names=["ocup"])
+    assert filtered["var_wgt"].tolist() == ["1"]
+
+
+def test_esquema_fijo_sin_filas(monkeypatch):
+    df_vars, _ = _run(monkeypatch, var_names=["no_existe"])
+    assert df_vars.empty
+    assert df_vars.dtypes.to_dict() == dane.VAR_DTYPES
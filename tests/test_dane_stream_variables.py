@@ -0,0 +1,51 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip("ijson")
+
+from DANE.dane_extract_clean import _iter_stream_variables, parse_variables  # noqa: E402
+
+# `variables` va antes de `files` (md solo queda completo al agotar el iterador) y
+# hay llaves `variables` anidadas que no deben confundirse con la de primer nivel
+METADATA = {
+    "title": "Encuesta",
+    "study_desc": {"title_statement": {"title": "T"}, "variables": [{"name": "NO_ES_VAR"}]},
+    "variables": [
+        {"name": "INGLABO", "labl": " Ingreso ", "files": [1, "3", "x"],
+         "qstn": {"qstn_qstnlit": "¿Cuánto?"},
+         "var_catgry": [{"value": 1, "labl": "Sí"}, {"value": 2, "labl": "No", "stats": [1.5, None]}]},
+        {"name": "OCUP", "file_id": 3, "categories": {"var_catgry": [{"value": "a", "label": "ñ"}]},
+         "variables": [{"name": "ANIDADA"}]},
+        {"name": "P6020", "files": [], "notes": "n", "var_dcml": 0},
+        {"name": "  ", "labl": "vacía"},
+        {"name": "SIN_ARCHIVO", "files": None, "var_catgry": []},
+    ],
+    "files": [{"file_id": 1, "file_name": "hogares"}, {"file_id": 3, "file_name": "personas"}],
+    "doi": None,
+}
+
+
+def _stream(metadata):
+    md = {}
+    raw = io.BytesIO(json.dumps(metadata).encode("utf-8"))
+    return md, parse_variables(md, 7, variables=_iter_stream_variables(raw, md))
+
+
+def test_stream_igual_a_parseo_completo():
+    md, streamed = _stream(METADATA)
+    assert streamed == parse_variables(METADATA, 7)
+    assert streamed["var_name"] == ["INGLABO", "OCUP", "P6020", "SIN_ARCHIVO"]
+    assert streamed["file_ids"] == ["1;3", "3", None, None]
+    assert streamed["file_names"] == ["hogares;personas", "personas", None, None]
+    # Llaves de primer nivel (menos variables) quedan en md tal cual
+    assert md == {k: v for k, v in METADATA.items() if k != "variables"}
+
+
+def test_stream_sin_variables():
+    for metadata in ({"title": "x", "variables": []}, {"title": "x", "files": []}):
+        md, streamed = _stream(metadata)
+        assert streamed == parse_variables(metadata, 7)
+        assert streamed["var_name"] == []
+        assert md["title"] == "x"